@@ -0,0 +1,461 @@
+import json
+import os
+import platform
+import threading
+import time
+from scservo_sdk import *
+import serial
+import serial.tools.list_ports
+from gesture_store import GestureStore
+from sim_backend import (GESTURE_STEP_DELAY, SIMULATION_DEVICE, HandSimulation, RealtimeSimulation, default_pose,
+                         load_model, run_batch, thumb_clearance_stages)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Control table address for Feetech SCServo
+ADDR_SCS_TORQUE_ENABLE = 40
+ADDR_SCS_GOAL_POSITION = 42
+
+# Feetech Servo Setup
+BAUDRATE = 1000000
+
+# Set a timeout for servo communication (in seconds)
+SERVO_TIMEOUT = 1.0  # Reduced from 5.0 for faster response
+
+def get_available_ports():
+    """Return a list of available serial ports."""
+    try:
+        ports = [port.device for port in serial.tools.list_ports.comports()]
+        return ports
+    except Exception as e:
+        print(f"Error listing serial ports: {e}")
+        return []
+
+def get_permission_instructions(device_name):
+    """Return OS-specific instructions for fixing serial port permission issues."""
+    os_name = platform.system()
+    if os_name == "Linux":
+        return (
+            f"Permission denied for {device_name}. "
+            "Try adding your user to the 'dialout' group with:\n"
+            "  sudo usermod -a -G dialout $USER\n"
+            "Then log out and back in. Alternatively, run the script with sudo:\n"
+            "  sudo python3 server.py\n"
+            "Or change the port permissions:\n"
+            f"  sudo chmod 666 {device_name}"
+        )
+    elif os_name == "Darwin":  # macOS
+        return (
+            f"Permission denied for {device_name}. "
+            "Ensure your user has access to serial ports. Try running with sudo:\n"
+            "  sudo python3 server.py\n"
+            "Or change the port permissions:\n"
+            f"  sudo chmod 666 {device_name}"
+        )
+    elif os_name == "Windows":
+        return (
+            f"Permission denied for {device_name}. "
+            "Ensure no other program is using the port. "
+            "Try running the script as Administrator:\n"
+            "  Right-click on your terminal or IDE and select 'Run as Administrator'."
+        )
+    else:
+        return (
+            f"Permission denied for {device_name}. "
+            "Ensure your user has access to the serial port or run the script with elevated privileges."
+        )
+
+class HandController:
+    """In-process control of the hand, shared by the HTTP server and Python scripts.
+
+    Nothing is loaded or opened until first use: the gesture store is opened
+    (and migrated from gestures.json) on the first call that needs it, and the
+    servos or simulation only when connect() is called.
+
+    Example:
+        hand = HandController()
+        hand.connect("/dev/ttyUSB0")
+        hand.set_positions([80] * len(hand.servo_ids))
+        hand.execute("fist")
+        hand.play("sequence_1")
+        hand.close()
+    """
+
+    def __init__(self, db_path=os.path.join(BASE_DIR, 'gestures.db'),
+                 json_path=os.path.join(BASE_DIR, 'gestures.json'), verbose=False):
+        self.db_path = db_path
+        self.json_path = json_path
+        self.verbose = verbose
+
+        self._store = None
+        self._servo_limits = {}
+        self._limits = []  # (servo_id, min, max) in servo_ids order, for set_positions
+        self.current_positions = {}
+
+        self.portHandler = None
+        self.packetHandler = PacketHandler(1)
+        self.groupSyncWrite = None
+
+        # Simulation backend, used instead of the servos when connected to SIMULATION_DEVICE
+        self.simulation = None
+        self.sim_model = None
+
+        # Lock for gesture execution
+        self.gesture_lock = threading.Lock()
+        # Lock for building and sending sync write packets
+        self.write_lock = threading.Lock()
+        self.load_lock = threading.Lock()
+
+    # Lazy initialization
+
+    def load(self):
+        """Open the gesture store, migrating gestures.json on first run."""
+        with self.load_lock:
+            if self._store is not None:
+                return
+            store = GestureStore(self.db_path)
+            if store.is_empty():
+                try:
+                    with open(self.json_path, 'r') as f:
+                        store.import_data(json.load(f))
+                    print(f"Migrated {self.json_path} to {store.path}")
+                except FileNotFoundError:
+                    store.close()
+                    raise RuntimeError("gestures.json not found. Please create it with initial gesture positions.")
+
+            servo_limits = store.get_config("servo_limits", {})
+            if not servo_limits:
+                store.close()
+                raise RuntimeError("servo_limits not found in gestures.json. Please define servo limits.")
+            self._set_servo_limits(servo_limits)
+            # Initialize current_positions with proper default positions
+            self.current_positions = default_pose(servo_limits)
+
+            # Only generate common gestures if the store has none
+            if store.gesture_count() == 0:
+                for name, positions in self.generate_common_gestures().items():
+                    store.save_gesture(name, positions)
+                print(f"Common gestures generated and saved to {store.path}")
+            else:
+                print(f"Gestures loaded from {store.path}")
+            self._store = store
+
+    @property
+    def store(self):
+        if self._store is None:
+            self.load()
+        return self._store
+
+    @property
+    def servo_limits(self):
+        if self._store is None:
+            self.load()
+        return self._servo_limits
+
+    @property
+    def servo_ids(self):
+        """Integer servo ids, in the order used by set_positions and read_state."""
+        if self._store is None:
+            self.load()
+        return [servo_id for servo_id, _, _ in self._limits]
+
+    def _set_servo_limits(self, servo_limits):
+        self._servo_limits = servo_limits
+        self._limits = sorted((int(sid.split('_')[1]), limits["min"], limits["max"]) for sid, limits in servo_limits.items())
+
+    def update_servo_limits(self, servo_limits):
+        self.store.set_config("servo_limits", servo_limits)
+        self._set_servo_limits(servo_limits)
+        # A running simulation maps servo positions onto joint angles with these limits
+        simulation = self.simulation
+        if simulation:
+            simulation.sim.servo_limits = servo_limits
+
+    @property
+    def connected(self):
+        return bool(self.groupSyncWrite or self.simulation)
+
+    def default_positions(self):
+        """Return the default pose: thumb MCP roll at min, all other servos at min + offset."""
+        return default_pose(self.servo_limits)
+
+    # Generate common gestures dynamically
+    def generate_common_gestures(self):
+        servo_limits = self._servo_limits
+        common_gestures = {
+            "fist": {servo: limits["max"] for servo, limits in servo_limits.items()},
+            "point": {servo: limits["max"] if servo not in ["servo_6", "servo_8"] else limits["min"] for servo, limits in servo_limits.items()},
+            "peace": {servo: limits["max"] if servo not in ["servo_4", "servo_5", "servo_6", "servo_8"] else limits["min"] for servo, limits in servo_limits.items()}
+        }
+        return common_gestures
+
+    # Connection
+
+    def connect(self, device_name):
+        """Connect to a serial device, or to the simulation backend. Returns (success, message)."""
+        self.load()
+        self.stop_simulation()
+        if device_name == SIMULATION_DEVICE:
+            self.groupSyncWrite = None
+            return self.initialize_simulation()
+        success, message = self.initialize_servos(device_name)
+        if success:
+            self.groupSyncWrite = GroupSyncWrite(self.portHandler, self.packetHandler, ADDR_SCS_GOAL_POSITION, 2)
+        return success, message
+
+    def initialize_servos(self, device_name):
+        """Initialize servo connection with detailed error handling."""
+        try:
+            available_ports = get_available_ports()
+            if device_name not in available_ports:
+                error_msg = f"Port {device_name} not found. Available ports: {available_ports or 'None'}"
+                print(error_msg)
+                return False, error_msg
+
+            self.portHandler = PortHandler(device_name)
+            if not self.portHandler.openPort():
+                error_msg = f"Failed to open port {device_name}. Ensure the device is connected and not in use."
+                print(error_msg)
+                return False, error_msg
+            print(f"Port {device_name} opened successfully")
+
+            if not self.portHandler.setBaudRate(BAUDRATE):
+                error_msg = f"Failed to set baud rate {BAUDRATE} on {device_name}."
+                print(error_msg)
+                self.portHandler.closePort()
+                return False, error_msg
+            print(f"Baud rate {BAUDRATE} set successfully")
+
+            for servo_id in self.servo_ids:
+                self.portHandler.setPacketTimeout(SERVO_TIMEOUT * 1000)
+                scs_comm_result, scs_error = self.packetHandler.write1ByteTxRx(self.portHandler, servo_id, ADDR_SCS_TORQUE_ENABLE, 1)
+                if scs_comm_result != COMM_SUCCESS:
+                    error_msg = f"Communication error enabling torque for servo {servo_id}: {self.packetHandler.getTxRxResult(scs_comm_result)}"
+                    print(error_msg)
+                    self.portHandler.closePort()
+                    return False, error_msg
+                if scs_error != 0:
+                    error_msg = f"Error enabling torque for servo {servo_id}: {self.packetHandler.getRxPacketError(scs_error)}"
+                    print(error_msg)
+                    self.portHandler.closePort()
+                    return False, error_msg
+                print(f"Torque enabled for servo {servo_id}")
+            return True, "Connected successfully"
+        except serial.SerialException as e:
+            if "Permission denied" in str(e):
+                error_msg = get_permission_instructions(device_name)
+            else:
+                error_msg = f"Serial error initializing servos on {device_name}: {str(e)}"
+            print(error_msg)
+            return False, error_msg
+        except Exception as e:
+            error_msg = f"Unexpected error initializing servos on {device_name}: {str(e)}"
+            print(error_msg)
+            return False, error_msg
+
+    def initialize_simulation(self):
+        """Start the headless MuJoCo simulation backend in real-time lockstep."""
+        try:
+            if self.sim_model is None:
+                self.sim_model = load_model()
+            sim = HandSimulation(self.servo_limits, model=self.sim_model)
+            sim.reset(self.current_positions)
+            simulation = RealtimeSimulation(sim)
+            simulation.start()
+            self.simulation = simulation
+            print("Simulation started")
+            return True, "Connected successfully"
+        except Exception as e:
+            error_msg = f"Failed to start simulation: {str(e)}"
+            print(error_msg)
+            return False, error_msg
+
+    def stop_simulation(self):
+        simulation, self.simulation = self.simulation, None
+        if simulation:
+            simulation.stop()
+            print("Simulation stopped")
+
+    def close(self):
+        """Stop the simulation, disable torque, close the port and the gesture store."""
+        self.stop_simulation()
+        with self.write_lock:
+            if self.portHandler and self.portHandler.is_open:
+                for servo_id in self.servo_ids:
+                    try:
+                        self.portHandler.setPacketTimeout(SERVO_TIMEOUT * 1000)
+                        scs_comm_result, scs_error = self.packetHandler.write1ByteTxRx(self.portHandler, servo_id, ADDR_SCS_TORQUE_ENABLE, 0)
+                        if scs_comm_result != COMM_SUCCESS:
+                            print(f"Error disabling torque for servo {servo_id}: {self.packetHandler.getTxRxResult(scs_comm_result)}")
+                        if scs_error != 0:
+                            print(f"Error disabling torque for servo {servo_id}: {self.packetHandler.getRxPacketError(scs_error)}")
+                    except Exception as e:
+                        print(f"Error disabling torque for servo {servo_id}: {e}")
+                self.portHandler.closePort()
+                print("Port closed successfully")
+            self.groupSyncWrite = None
+        if self._store is not None:
+            self._store.close()
+            self._store = None
+
+    # Motion
+
+    def move_servos(self, servo_positions):
+        """Send goal positions keyed by integer servo id to the connected backend."""
+        # Read once: a concurrent connect() may stop the simulation at any time
+        simulation = self.simulation
+        if simulation:
+            simulation.sim.set_servo_positions(servo_positions)
+            self.current_positions.update(servo_positions)
+            return True
+        # One sync packet at a time: the server threads and scripts share groupSyncWrite
+        with self.write_lock:
+            if not self.groupSyncWrite:
+                print("Servos not connected")
+                return False
+            start_time = time.time()
+            self.groupSyncWrite.clearParam()
+            for servo_id, position in servo_positions.items():
+                param_goal_position = [SCS_LOBYTE(position), SCS_HIBYTE(position)]
+                try:
+                    success = self.groupSyncWrite.addParam(servo_id, param_goal_position)
+                    if not success:
+                        print(f"Failed to add parameter for servo {servo_id}")
+                        return False
+                except Exception as e:
+                    print(f"Error adding parameter for servo {servo_id}: {e}")
+                    return False
+
+            try:
+                self.portHandler.setPacketTimeout(SERVO_TIMEOUT * 1000)
+                scs_comm_result = self.groupSyncWrite.txPacket()
+                if self.verbose:
+                    elapsed_time = (time.time() - start_time) * 1000
+                    print(f"Servo update took {elapsed_time:.2f} ms, COMM_RESULT: {scs_comm_result}")
+                if scs_comm_result != COMM_SUCCESS:
+                    print(f"Failed to move servos, COMM_RESULT: {self.packetHandler.getTxRxResult(scs_comm_result)}")
+                    return False
+                self.current_positions.update(servo_positions)
+                return True
+            except Exception as e:
+                print(f"Error moving servos: {e}")
+                return False
+
+    def _apply(self, servo_positions):
+        # Positions are tracked even when not connected, for URDF sync
+        self.current_positions.update(servo_positions)
+        if self.connected:
+            return self.move_servos(servo_positions)
+        return True
+
+    def set_positions(self, positions):
+        """Move all servos at once from an array of positions ordered like servo_ids.
+
+        Positions are clamped to the servo limits. This is the fast path for
+        high-rate control loops: no dict keys to parse and no HTTP round-trip.
+        """
+        if self._store is None:
+            self.load()
+        if len(positions) != len(self._limits):
+            raise ValueError(f"Expected {len(self._limits)} positions, got {len(positions)}")
+        servo_positions = {}
+        for (servo_id, min_pos, max_pos), value in zip(self._limits, positions):
+            servo_positions[servo_id] = max(min_pos, min(int(round(value)), max_pos))
+        return self._apply(servo_positions)
+
+    def update_positions(self, positions):
+        """Move the servos named in positions ({"servo_1": value, ...}), clamped to their limits."""
+        servo_limits = self.servo_limits
+        servo_positions = {}
+        for servo_id, value in positions.items():
+            min_pos = servo_limits[servo_id]["min"]
+            max_pos = servo_limits[servo_id]["max"]
+            servo_positions[int(servo_id.split('_')[1])] = max(min_pos, min(value, max_pos))
+        return self._apply(servo_positions)
+
+    def reset_positions(self):
+        """Reset the tracked positions to the default pose without moving the servos."""
+        self.current_positions.update(self.default_positions())
+
+    def move_to_default(self):
+        return self._apply(self.default_positions())
+
+    def execute(self, gesture, thumb_clearance=False):
+        """Move to a stored gesture. Returns False if the gesture does not exist or a move fails."""
+        with self.gesture_lock:
+            target_positions = self.store.get_gesture(gesture)
+            if target_positions is None:
+                print(f"Gesture {gesture} not found")
+                return False
+            target_positions_int = {int(servo.split('_')[1]): value for servo, value in target_positions.items()}
+
+            if thumb_clearance:
+                # Use faster delay for thumb clearance mode
+                gesture_step_delay = self.store.get_config("settings", {}).get("gesture_step_delay", GESTURE_STEP_DELAY) / 1000.0
+
+                # Move servo_12 to min (thumb clearance), then the finger servos (1-8),
+                # then the thumb servos (9, 10, 12)
+                stages = thumb_clearance_stages(self.servo_limits, target_positions_int)
+                success = True
+                for i, stage in enumerate(stages):
+                    if i:
+                        time.sleep(gesture_step_delay)
+                    success &= self._apply(stage)
+            else:
+                # Execute gesture instantly without any delays
+                success = self._apply(target_positions_int)
+            return success
+
+    def play(self, sequence, thumb_clearance=False):
+        """Play a stored sequence once, waiting each step's delay.
+
+        Returns False if the sequence is not found, or stops and returns False
+        at the first step that fails.
+        """
+        steps = self.store.get_sequence(sequence)
+        if steps is None:
+            print(f"Sequence {sequence} not found")
+            return False
+        default_delay = self.store.get_config("settings", {}).get("default_sequence_step_delay", 2000)
+        for step in steps:
+            if not self.execute(step["gesture"], thumb_clearance):
+                print(f"Sequence {sequence} stopped at gesture {step['gesture']}")
+                return False
+            time.sleep(step.get("delay", default_delay) / 1000.0)
+        return True
+
+    def read_state(self):
+        """Return the current positions as an array ordered like servo_ids, plus simulation state."""
+        state = {
+            "servo_ids": self.servo_ids,
+            "positions": [self.current_positions.get(servo_id) for servo_id in self.servo_ids],
+            "connected": self.connected,
+        }
+        simulation = self.simulation
+        if simulation:
+            state["simulation"] = simulation.sim.read_state()
+        return state
+
+    def simulate(self, sequence_ids=None, gesture_names=None, thumb_clearance=False):
+        """Validate gestures and sequences in simulation, as fast as possible (batch mode)."""
+        if self.sim_model is None:
+            self.sim_model = load_model()
+        if sequence_ids is None and gesture_names is None:
+            library = self.store.to_dict()
+        else:
+            sequence_ids = sequence_ids or []
+            gesture_names = gesture_names or []
+            library = self.store.subset(gesture_names, sequence_ids)
+        return run_batch(library, sequence_ids=sequence_ids, gesture_names=gesture_names,
+                         default_positions=self.default_positions(), model=self.sim_model,
+                         thumb_clearance=thumb_clearance)
+
+    def serve(self, port=8000, background=False):
+        """Start the HTTP server and web interface for this controller.
+
+        Blocks until interrupted, unless background is True, in which case the
+        server runs on a daemon thread and is returned.
+        """
+        from server import serve
+        self.load()
+        return serve(self, port, background)
@@ -0,0 +1,254 @@
+import json
+import sqlite3
+import threading
+
+# SQLite database holding servo limits, settings, gestures and sequences
+DB_PATH = 'gestures.db'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS config (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS gestures (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    positions TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sequences (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS sequence_steps (
+    sequence INTEGER NOT NULL REFERENCES sequences(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    gesture TEXT NOT NULL,
+    step TEXT NOT NULL,
+    PRIMARY KEY (sequence, position)
+);
+-- Reverse index: which sequences reference a gesture
+CREATE INDEX IF NOT EXISTS sequence_steps_gesture ON sequence_steps(gesture);
+"""
+
+
+def _prefix_filter(prefix):
+    """Return an index-friendly (clause, params) matching names starting with prefix."""
+    if not prefix:
+        return "1", ()
+    # SQLite compares names as UTF-8 bytes, which sort in code point order, so the
+    # upper bound is the prefix with its last code point incremented
+    stem = prefix.rstrip('\U0010ffff')
+    if not stem:
+        return "name >= ?", (prefix,)
+    code = ord(stem[-1]) + 1
+    if 0xD800 <= code <= 0xDFFF:  # Skip surrogates, which cannot be encoded
+        code = 0xE000
+    return "name >= ? AND name < ?", (prefix, stem[:-1] + chr(code))
+
+
+class GestureStore:
+    """Indexed storage for gestures and sequences, backed by SQLite in WAL mode.
+
+    Gestures and sequences keep their insertion order, like the sections of
+    gestures.json they are migrated from.
+    """
+
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def is_empty(self):
+        """Return True if nothing has been imported yet."""
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM config LIMIT 1").fetchone() is None
+
+    # Servo limits and settings
+
+    def get_config(self, key, default=None):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM config WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set_config(self, key, value):
+        with self.lock, self.conn:
+            self._set_config(key, value)
+
+    def _set_config(self, key, value):
+        self.conn.execute(
+            "INSERT INTO config (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, json.dumps(value)))
+
+    # Gestures
+
+    def gesture_count(self, prefix=None):
+        query, params = _prefix_filter(prefix)
+        with self.lock:
+            return self.conn.execute(f"SELECT COUNT(*) FROM gestures WHERE {query}", params).fetchone()[0]
+
+    def list_gestures(self, offset=0, limit=None, prefix=None, fields=None):
+        """Return a page of gestures as {name: positions}, optionally filtered by name prefix."""
+        query, params = _prefix_filter(prefix)
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT name, positions FROM gestures WHERE {query} ORDER BY id LIMIT ? OFFSET ?",
+                (*params, -1 if limit is None else limit, offset)).fetchall()
+        return {name: self._select_fields(json.loads(positions), fields) for name, positions in rows}
+
+    def get_gesture(self, name, fields=None):
+        """Return the positions of a single gesture, or None if it does not exist."""
+        with self.lock:
+            row = self.conn.execute("SELECT positions FROM gestures WHERE name = ?", (name,)).fetchone()
+        return self._select_fields(json.loads(row[0]), fields) if row else None
+
+    def has_gesture(self, name):
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM gestures WHERE name = ?", (name,)).fetchone() is not None
+
+    def save_gesture(self, name, positions):
+        with self.lock, self.conn:
+            self._save_gesture(name, positions)
+
+    def _save_gesture(self, name, positions):
+        self.conn.execute(
+            "INSERT INTO gestures (name, positions) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET positions = excluded.positions",
+            (name, json.dumps(positions)))
+
+    def remove_gesture(self, name):
+        """Delete a gesture and every sequence step referencing it. Returns False if not found."""
+        with self.lock, self.conn:
+            deleted = self.conn.execute("DELETE FROM gestures WHERE name = ?", (name,)).rowcount
+            if deleted:
+                self.conn.execute("DELETE FROM sequence_steps WHERE gesture = ?", (name,))
+        return bool(deleted)
+
+    def gesture_sequences(self, name):
+        """Return the names of the sequences that reference a gesture."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT name FROM sequences WHERE id IN (SELECT sequence FROM sequence_steps WHERE gesture = ?) "
+                "ORDER BY id", (name,)).fetchall()
+        return [row[0] for row in rows]
+
+    @staticmethod
+    def _select_fields(positions, fields):
+        if not fields:
+            return positions
+        return {field: positions[field] for field in fields if field in positions}
+
+    # Sequences
+
+    def sequence_count(self, prefix=None, gesture=None):
+        query, params = self._sequence_filter(prefix, gesture)
+        with self.lock:
+            return self.conn.execute(f"SELECT COUNT(*) FROM sequences WHERE {query}", params).fetchone()[0]
+
+    def list_sequences(self, offset=0, limit=None, prefix=None, gesture=None):
+        """Return a page of sequences as {name: steps}, optionally only those using a gesture."""
+        query, params = self._sequence_filter(prefix, gesture)
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT id, name FROM sequences WHERE {query} ORDER BY id LIMIT ? OFFSET ?",
+                (*params, -1 if limit is None else limit, offset)).fetchall()
+            steps = self._steps([row[0] for row in rows])
+        return {name: steps.get(sequence_id, []) for sequence_id, name in rows}
+
+    def get_sequence(self, name):
+        with self.lock:
+            row = self.conn.execute("SELECT id FROM sequences WHERE name = ?", (name,)).fetchone()
+            if row is None:
+                return None
+            return self._steps([row[0]]).get(row[0], [])
+
+    def has_sequence(self, name):
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM sequences WHERE name = ?", (name,)).fetchone() is not None
+
+    def save_sequence(self, name, steps):
+        with self.lock, self.conn:
+            self._save_sequence(name, steps)
+
+    def _save_sequence(self, name, steps):
+        self.conn.execute("INSERT INTO sequences (name) VALUES (?) ON CONFLICT(name) DO NOTHING", (name,))
+        sequence_id = self.conn.execute("SELECT id FROM sequences WHERE name = ?", (name,)).fetchone()[0]
+        self.conn.execute("DELETE FROM sequence_steps WHERE sequence = ?", (sequence_id,))
+        self.conn.executemany(
+            "INSERT INTO sequence_steps (sequence, position, gesture, step) VALUES (?, ?, ?, ?)",
+            [(sequence_id, position, step.get("gesture", ""), json.dumps(step)) for position, step in enumerate(steps)])
+
+    def delete_sequence(self, name):
+        """Delete a sequence and its steps. Returns False if not found."""
+        with self.lock, self.conn:
+            return bool(self.conn.execute("DELETE FROM sequences WHERE name = ?", (name,)).rowcount)
+
+    def _sequence_filter(self, prefix, gesture):
+        query, params = _prefix_filter(prefix)
+        if gesture is not None:
+            query += " AND id IN (SELECT sequence FROM sequence_steps WHERE gesture = ?)"
+            params += (gesture,)
+        return query, params
+
+    def _steps(self, sequence_ids):
+        steps = {}
+        if not sequence_ids:
+            return steps
+        placeholders = ", ".join("?" * len(sequence_ids))
+        rows = self.conn.execute(
+            f"SELECT sequence, step FROM sequence_steps WHERE sequence IN ({placeholders}) ORDER BY sequence, position",
+            sequence_ids).fetchall()
+        for sequence_id, step in rows:
+            steps.setdefault(sequence_id, []).append(json.loads(step))
+        return steps
+
+    # Import and export
+
+    def import_data(self, data):
+        """Merge a gestures.json style dict into the store in a single transaction."""
+        with self.lock, self.conn:
+            for key in ("servo_limits", "settings"):
+                if key in data:
+                    self._set_config(key, data[key])
+            for name, positions in data.get("gestures", {}).items():
+                self._save_gesture(name, positions)
+            for name, steps in data.get("sequences", {}).items():
+                self._save_sequence(name, steps)
+
+    def subset(self, gesture_names, sequence_names):
+        """Return the named gestures and sequences, plus the gestures those sequences use."""
+        sequences = {}
+        for name in sequence_names:
+            steps = self.get_sequence(name)
+            if steps is not None:
+                sequences[name] = steps
+        names = list(gesture_names) + [step.get("gesture") for steps in sequences.values() for step in steps]
+        gestures = {}
+        for name in names:
+            if name not in gestures:
+                positions = self.get_gesture(name)
+                if positions is not None:
+                    gestures[name] = positions
+        return {
+            "servo_limits": self.get_config("servo_limits", {}),
+            "settings": self.get_config("settings", {}),
+            "gestures": gestures,
+            "sequences": sequences,
+        }
+
+    def to_dict(self):
+        """Return the whole library in the gestures.json layout."""
+        return {
+            "servo_limits": self.get_config("servo_limits", {}),
+            "settings": self.get_config("settings", {}),
+            "gestures": self.list_gestures(),
+            "sequences": self.list_sequences(),
+        }
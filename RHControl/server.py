@@ -1,244 +1,27 @@
+import functools
 import json
+import os
 import http.server
 import socketserver
 import time
 import signal
 import sys
 import socket
-import platform
-from scservo_sdk import *
-import serial
-import serial.tools.list_ports
 import threading
-
-# Control table address for Feetech SCServo
-ADDR_SCS_TORQUE_ENABLE = 40
-ADDR_SCS_GOAL_POSITION = 42
-
-# Feetech Servo Setup
-BAUDRATE = 1000000
-portHandler = None
-packetHandler = PacketHandler(1)
-
-# Set a timeout for servo communication (in seconds)
-SERVO_TIMEOUT = 1.0  # Reduced from 5.0 for faster response
+from urllib.parse import urlparse, parse_qs
+from controller import BASE_DIR, HandController, get_available_ports
 
 # Global variable to track server shutdown
 server_shutdown = False
 
-# Global variables
-servo_limits = {}
-current_positions = {}
-gestures = {}
+# Controller driven by the HTTP handlers, set by serve()
+controller = None
 
-# Lock for gesture execution
-gesture_lock = threading.Lock()
-
-def get_available_ports():
-    """Return a list of available serial ports."""
-    try:
-        ports = [port.device for port in serial.tools.list_ports.comports()]
-        return ports
-    except Exception as e:
-        print(f"Error listing serial ports: {e}")
-        return []
-
-def get_permission_instructions(device_name):
-    """Return OS-specific instructions for fixing serial port permission issues."""
-    os_name = platform.system()
-    if os_name == "Linux":
-        return (
-            f"Permission denied for {device_name}. "
-            "Try adding your user to the 'dialout' group with:\n"
-            "  sudo usermod -a -G dialout $USER\n"
-            "Then log out and back in. Alternatively, run the script with sudo:\n"
-            "  sudo python3 server.py\n"
-            "Or change the port permissions:\n"
-            f"  sudo chmod 666 {device_name}"
-        )
-    elif os_name == "Darwin":  # macOS
-        return (
-            f"Permission denied for {device_name}. "
-            "Ensure your user has access to serial ports. Try running with sudo:\n"
-            "  sudo python3 server.py\n"
-            "Or change the port permissions:\n"
-            f"  sudo chmod 666 {device_name}"
-        )
-    elif os_name == "Windows":
-        return (
-            f"Permission denied for {device_name}. "
-            "Ensure no other program is using the port. "
-            "Try running the script as Administrator:\n"
-            "  Right-click on your terminal or IDE and select 'Run as Administrator'."
-        )
-    else:
-        return (
-            f"Permission denied for {device_name}. "
-            "Ensure your user has access to the serial port or run the script with elevated privileges."
-        )
-
-def initialize_servos(device_name):
-    """Initialize servo connection with detailed error handling."""
-    global portHandler
-    try:
-        available_ports = get_available_ports()
-        if device_name not in available_ports:
-            error_msg = f"Port {device_name} not found. Available ports: {available_ports or 'None'}"
-            print(error_msg)
-            return False, error_msg
-
-        portHandler = PortHandler(device_name)
-        if not portHandler.openPort():
-            error_msg = f"Failed to open port {device_name}. Ensure the device is connected and not in use."
-            print(error_msg)
-            return False, error_msg
-        print(f"Port {device_name} opened successfully")
-
-        if not portHandler.setBaudRate(BAUDRATE):
-            error_msg = f"Failed to set baud rate {BAUDRATE} on {device_name}."
-            print(error_msg)
-            portHandler.closePort()
-            return False, error_msg
-        print(f"Baud rate {BAUDRATE} set successfully")
-
-        for servo_id in [int(sid.split('_')[1]) for sid in servo_limits.keys()]:
-            portHandler.setPacketTimeout(SERVO_TIMEOUT * 1000)
-            scs_comm_result, scs_error = packetHandler.write1ByteTxRx(portHandler, servo_id, ADDR_SCS_TORQUE_ENABLE, 1)
-            if scs_comm_result != COMM_SUCCESS:
-                error_msg = f"Communication error enabling torque for servo {servo_id}: {packetHandler.getTxRxResult(scs_comm_result)}"
-                print(error_msg)
-                portHandler.closePort()
-                return False, error_msg
-            if scs_error != 0:
-                error_msg = f"Error enabling torque for servo {servo_id}: {packetHandler.getRxPacketError(scs_error)}"
-                print(error_msg)
-                portHandler.closePort()
-                return False, error_msg
-            print(f"Torque enabled for servo {servo_id}")
-        return True, "Connected successfully"
-    except serial.SerialException as e:
-        if "Permission denied" in str(e):
-            error_msg = get_permission_instructions(device_name)
-        else:
-            error_msg = f"Serial error initializing servos on {device_name}: {str(e)}"
-        print(error_msg)
-        return False, error_msg
-    except Exception as e:
-        error_msg = f"Unexpected error initializing servos on {device_name}: {str(e)}"
-        print(error_msg)
-        return False, error_msg
-
-# Initialize GroupSyncWrite for goal position
-groupSyncWrite = None
-
-# Load gestures from JSON
-try:
-    with open('gestures.json', 'r') as f:
-        gestures = json.load(f)
-    servo_limits = gestures.get("servo_limits", {})
-    if not servo_limits:
-        print("servo_limits not found in gestures.json. Please define servo limits.")
-        sys.exit(1)
-    # Initialize current_positions with proper default positions
-    current_positions = {}
-    for sid, limits in servo_limits.items():
-        servo_id_int = int(sid.split('_')[1])
-        if sid == 'servo_12':  # Thumb MCP roll - use min
-            current_positions[servo_id_int] = limits["min"]
-        else:  # All other servos - use min + offset
-            offset = 60  # Default offset
-            current_positions[servo_id_int] = min(limits["min"] + offset, limits["max"])
-except FileNotFoundError:
-    print("gestures.json not found. Please create it with initial gesture positions.")
-    sys.exit(1)
-
-# Ensure sequences and settings keys exist
-if "sequences" not in gestures:
-    gestures["sequences"] = {}
-if "settings" not in gestures:
-    gestures["settings"] = {}
-
-# Generate common gestures dynamically
-def generate_common_gestures():
-    common_gestures = {
-        "fist": {servo: limits["max"] for servo, limits in servo_limits.items()},
-        "point": {servo: limits["max"] if servo not in ["servo_6", "servo_8"] else limits["min"] for servo, limits in servo_limits.items()},
-        "peace": {servo: limits["max"] if servo not in ["servo_4", "servo_5", "servo_6", "servo_8"] else limits["min"] for servo, limits in servo_limits.items()}
-    }
-    return common_gestures
-
-# Only generate common gestures if they don't exist in the JSON file
-if "gestures" not in gestures or not gestures["gestures"]:
-    gestures["gestures"] = generate_common_gestures()
-    with open('gestures.json', 'w') as f:
-        json.dump(gestures, f, indent=2)
-    print("Common gestures generated and saved to gestures.json")
-else:
-    print("Gestures loaded from gestures.json")
-
-def move_servos(servo_positions):
-    global current_positions
-    if not groupSyncWrite:
-        print("Servos not connected")
-        return False
-    start_time = time.time()
-    groupSyncWrite.clearParam()
-    for servo_id, position in servo_positions.items():
-        param_goal_position = [SCS_LOBYTE(position), SCS_HIBYTE(position)]
-        try:
-            success = groupSyncWrite.addParam(servo_id, param_goal_position)
-            if not success:
-                print(f"Failed to add parameter for servo {servo_id}")
-                return False
-        except Exception as e:
-            print(f"Error adding parameter for servo {servo_id}: {e}")
-            return False
+# Hand tracking calibration saved from the web interface
+CALIBRATION_PATH = os.path.join(BASE_DIR, 'hand_calibration.json')
 
-    try:
-        portHandler.setPacketTimeout(SERVO_TIMEOUT * 1000)
-        scs_comm_result = groupSyncWrite.txPacket()
-        elapsed_time = (time.time() - start_time) * 1000
-        print(f"Servo update took {elapsed_time:.2f} ms, COMM_RESULT: {scs_comm_result}")
-        if scs_comm_result != COMM_SUCCESS:
-            print(f"Failed to move servos, COMM_RESULT: {packetHandler.getTxRxResult(scs_comm_result)}")
-            return False
-        for servo_id, position in servo_positions.items():
-            current_positions[servo_id] = position
-        return True
-    except Exception as e:
-        print(f"Error moving servos: {e}")
-        return False
-
-def execute_gesture(gesture, thumb_clearance=False):
-    with gesture_lock:
-        if gesture not in gestures["gestures"]:
-            print(f"Gesture {gesture} not found")
-            return
-        target_positions = gestures["gestures"][gesture]
-        target_positions_int = {int(servo.split('_')[1]): value for servo, value in target_positions.items()}
-
-        if thumb_clearance:
-            # Use faster delay for thumb clearance mode
-            gesture_step_delay = gestures.get("settings", {}).get("gesture_step_delay", 50) / 1000.0
-            
-            # Step 1: Move servo_12 to min (thumb clearance)
-            servo_12_min = servo_limits["servo_12"]["min"]
-            move_servos({12: servo_12_min})
-            time.sleep(gesture_step_delay)
-
-            # Step 2: Move finger servos (1-8)
-            finger_servos = [1, 2, 3, 4, 5, 6, 7, 8]
-            finger_positions = {sid: target_positions_int[sid] for sid in finger_servos if sid in target_positions_int}
-            move_servos(finger_positions)
-            time.sleep(gesture_step_delay)
-
-            # Step 3: Move thumb servos (9, 10, 12)
-            thumb_servos = [9, 10, 12]
-            thumb_positions = {sid: target_positions_int[sid] for sid in thumb_servos if sid in target_positions_int}
-            move_servos(thumb_positions)
-        else:
-            # Execute gesture instantly without any delays
-            move_servos(target_positions_int)
+# Query parameters that switch /gestures from the whole library to a paginated listing
+LISTING_PARAMS = {'offset', 'limit', 'prefix', 'fields'}
 
 class GestureHandler(http.server.SimpleHTTPRequestHandler):
     def end_headers(self):
@@ -257,11 +40,67 @@ class GestureHandler(http.server.SimpleHTTPRequestHandler):
         self.end_headers()
 
     def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
         if self.path == '/':
             print("Handling GET / (serving index.html)")
             self.path = '/index.html'
             super().do_GET()
-        elif self.path == '/gestures':
+        elif url.path == '/sequences' or (url.path == '/gestures' and LISTING_PARAMS.intersection(query)):
+            # Paginated listing: ?offset=0&limit=50&prefix=grip (&fields=servo_1,... or &gesture=fist)
+            print(f"Handling GET {self.path}")
+            try:
+                offset = int(query.get('offset', 0))
+                limit = int(query['limit']) if 'limit' in query else None
+            except ValueError:
+                self.send_response(400)
+                self.end_headers()
+                self.wfile.write(b"offset and limit must be integers")
+                return
+            prefix = query.get('prefix')
+            if url.path == '/gestures':
+                fields = query['fields'].split(',') if 'fields' in query else None
+                response = {
+                    "total": controller.store.gesture_count(prefix),
+                    "offset": offset,
+                    "limit": limit,
+                    "gestures": controller.store.list_gestures(offset, limit, prefix, fields),
+                }
+            else:
+                gesture = query.get('gesture')
+                response = {
+                    "total": controller.store.sequence_count(prefix, gesture),
+                    "offset": offset,
+                    "limit": limit,
+                    "sequences": controller.store.list_sequences(offset, limit, prefix, gesture),
+                }
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Cache-Control', 'no-cache, no-store, must-revalidate')
+            self.send_header('Pragma', 'no-cache')
+            self.send_header('Expires', '0')
+            self.end_headers()
+            self.wfile.write(json.dumps(response).encode())
+        elif url.path == '/gesture':
+            # Single gesture: ?name=fist (&fields=servo_1,servo_2)
+            print(f"Handling GET {self.path}")
+            fields = query['fields'].split(',') if 'fields' in query else None
+            positions = controller.store.get_gesture(query.get('name'), fields)
+            if positions is None:
+                self.send_response(404)
+                self.end_headers()
+                self.wfile.write(b"Gesture not found")
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Cache-Control', 'no-cache, no-store, must-revalidate')
+            self.send_header('Pragma', 'no-cache')
+            self.send_header('Expires', '0')
+            self.end_headers()
+            response = {"name": query['name'], "positions": positions, "sequences": controller.store.gesture_sequences(query['name'])}
+            self.wfile.write(json.dumps(response).encode())
+        elif url.path == '/gestures':
+            # Whole library in the gestures.json layout, as loaded by the web interface
             print("Handling GET /gestures")
             self.send_response(200)
             self.send_header('Content-Type', 'application/json')
@@ -269,7 +108,7 @@ class GestureHandler(http.server.SimpleHTTPRequestHandler):
             self.send_header('Pragma', 'no-cache')
             self.send_header('Expires', '0')
             self.end_headers()
-            self.wfile.write(json.dumps(gestures).encode())
+            self.wfile.write(json.dumps(controller.store.to_dict()).encode())
         elif self.path == '/current_positions':
             print("Handling GET /current_positions")
             self.send_response(200)
@@ -278,7 +117,7 @@ class GestureHandler(http.server.SimpleHTTPRequestHandler):
             self.send_header('Pragma', 'no-cache')
             self.send_header('Expires', '0')
             self.end_headers()
-            response = {f"servo_{servo_id}": position for servo_id, position in current_positions.items()}
+            response = {f"servo_{servo_id}": position for servo_id, position in controller.current_positions.items()}
             self.wfile.write(json.dumps(response).encode())
             
         elif self.path == '/position_updates':
@@ -291,13 +130,28 @@ class GestureHandler(http.server.SimpleHTTPRequestHandler):
             self.end_headers()
             
             # Send initial positions
-            response = {f"servo_{servo_id}": position for servo_id, position in current_positions.items()}
+            response = {f"servo_{servo_id}": position for servo_id, position in controller.current_positions.items()}
             self.wfile.write(f"data: {json.dumps(response)}\n\n".encode())
             self.wfile.flush()
             
             # Keep connection open for future updates
             # Note: This is a simplified SSE implementation
             # In a production environment, you'd want proper connection management
+        elif self.path == '/sim_state':
+            print("Handling GET /sim_state")
+            simulation = controller.simulation
+            if not simulation:
+                self.send_response(404)
+                self.end_headers()
+                self.wfile.write(b"Simulation not running")
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Cache-Control', 'no-cache, no-store, must-revalidate')
+            self.send_header('Pragma', 'no-cache')
+            self.send_header('Expires', '0')
+            self.end_headers()
+            self.wfile.write(json.dumps(simulation.sim.read_state()).encode())
         elif self.path == '/servo_limits':
             print("Handling GET /servo_limits")
             self.send_response(200)
@@ -306,7 +160,7 @@ class GestureHandler(http.server.SimpleHTTPRequestHandler):
             self.send_header('Pragma', 'no-cache')
             self.send_header('Expires', '0')
             self.end_headers()
-            self.wfile.write(json.dumps(gestures.get("servo_limits", {})).encode())
+            self.wfile.write(json.dumps(controller.servo_limits).encode())
         elif self.path == '/settings':
             print("Handling GET /settings")
             self.send_response(200)
@@ -315,7 +169,7 @@ class GestureHandler(http.server.SimpleHTTPRequestHandler):
             self.send_header('Pragma', 'no-cache')
             self.send_header('Expires', '0')
             self.end_headers()
-            self.wfile.write(json.dumps(gestures.get("settings", {})).encode())
+            self.wfile.write(json.dumps(controller.store.get_config("settings", {})).encode())
         elif self.path == '/available_ports':
             print("Handling GET /available_ports")
             self.send_response(200)
@@ -334,7 +188,7 @@ class GestureHandler(http.server.SimpleHTTPRequestHandler):
             self.send_header('Expires', '0')
             self.end_headers()
             try:
-                with open('descriptions/RoninHand.urdf', 'r') as f:
+                with open(os.path.join(BASE_DIR, 'descriptions', 'RoninHand.urdf'), 'r') as f:
                     self.wfile.write(f.read().encode())
             except Exception as e:
                 print(f"Error reading URDF file: {e}")
@@ -348,7 +202,7 @@ class GestureHandler(http.server.SimpleHTTPRequestHandler):
             self.send_header('Expires', '0')
             self.end_headers()
             try:
-                with open('hand_calibration.json', 'r') as f:
+                with open(CALIBRATION_PATH, 'r') as f:
                     self.wfile.write(f.read().encode())
             except FileNotFoundError:
                 # Return empty calibration if file doesn't exist
@@ -368,7 +222,7 @@ class GestureHandler(http.server.SimpleHTTPRequestHandler):
             self.wfile.write(json.dumps({"status": "permission_requested"}).encode())
         elif self.path.startswith('/meshes/'):
             print(f"Handling GET {self.path}")
-            mesh_path = f"descriptions/{self.path}"
+            mesh_path = os.path.join(BASE_DIR, "descriptions", self.path.lstrip("/"))
             try:
                 with open(mesh_path, 'rb') as f:
                     self.send_response(200)
@@ -385,8 +239,6 @@ class GestureHandler(http.server.SimpleHTTPRequestHandler):
             super().do_GET()
 
     def do_POST(self):
-        global groupSyncWrite
-        
         if server_shutdown:
             print("Server is shutting down, ignoring POST request")
             self.send_response(503)
@@ -403,23 +255,9 @@ class GestureHandler(http.server.SimpleHTTPRequestHandler):
         print(f"Received POST request on {self.path}")
 
         if self.path == '/update':
-            positions = data['positions']
-            servo_positions = {}
-            for servo_id, value in positions.items():
-                servo_id_int = int(servo_id.split('_')[1])
-                min_pos = gestures["servo_limits"][servo_id]["min"]
-                max_pos = gestures["servo_limits"][servo_id]["max"]
-                value = max(min_pos, min(value, max_pos))
-                servo_positions[servo_id_int] = value
-                # Update current_positions for URDF sync
-                current_positions[servo_id_int] = value
-            
-            # Only try to move servos if connected
-            if groupSyncWrite:
-                success = move_servos(servo_positions)
-            else:
-                success = True  # Consider it successful if not connected
-                
+            # Clamps to servo limits, and only moves the servos if connected
+            success = controller.update_positions(data['positions'])
+
             elapsed_time = (time.time() - start_time) * 1000
             print(f"Update request handled in {elapsed_time:.2f} ms")
             self.send_response(200 if success else 500)
@@ -431,13 +269,12 @@ class GestureHandler(http.server.SimpleHTTPRequestHandler):
         elif self.path == '/save':
             gesture = data['gesture']
             positions = data['positions']
+            servo_limits = controller.servo_limits
             for servo_id, value in positions.items():
-                min_pos = gestures["servo_limits"][servo_id]["min"]
-                max_pos = gestures["servo_limits"][servo_id]["max"]
+                min_pos = servo_limits[servo_id]["min"]
+                max_pos = servo_limits[servo_id]["max"]
                 positions[servo_id] = max(min_pos, min(value, max_pos))
-            gestures['gestures'][gesture] = positions
-            with open('gestures.json', 'w') as f:
-                json.dump(gestures, f, indent=2)
+            controller.store.save_gesture(gesture, positions)
             print(f"Saved gesture {gesture}")
             self.send_response(200)
             self.send_header('Cache-Control', 'no-cache, no-store, must-revalidate')
@@ -449,15 +286,8 @@ class GestureHandler(http.server.SimpleHTTPRequestHandler):
             gesture = data['gesture']
             thumb_clearance = data.get('thumb_clearance', False)
             
-            # Get gesture positions and update current_positions for URDF sync
-            if gesture in gestures['gestures']:
-                gesture_positions = gestures['gestures'][gesture]
-                for servo_id, position in gesture_positions.items():
-                    servo_id_int = int(servo_id.split('_')[1])
-                    current_positions[servo_id_int] = position
-            
             # Execute gesture asynchronously for instant response
-            threading.Thread(target=execute_gesture, args=(gesture, thumb_clearance), daemon=True).start()
+            threading.Thread(target=controller.execute, args=(gesture, thumb_clearance), daemon=True).start()
             self.send_response(200)
             self.send_header('Cache-Control', 'no-cache, no-store, must-revalidate')
             self.send_header('Pragma', 'no-cache')
@@ -466,14 +296,8 @@ class GestureHandler(http.server.SimpleHTTPRequestHandler):
             
         elif self.path == '/reset_positions':
             # Reset current_positions to default values
-            for servo_id, limits in gestures["servo_limits"].items():
-                servo_id_int = int(servo_id.split('_')[1])
-                if servo_id == 'servo_12':  # Thumb MCP roll - use min
-                    current_positions[servo_id_int] = limits["min"]
-                else:  # All other servos - use min + offset
-                    offset = 60  # Default offset
-                    current_positions[servo_id_int] = min(limits["min"] + offset, limits["max"])
-            
+            controller.reset_positions()
+
             self.send_response(200)
             self.send_header('Cache-Control', 'no-cache, no-store, must-revalidate')
             self.send_header('Pragma', 'no-cache')
@@ -482,24 +306,9 @@ class GestureHandler(http.server.SimpleHTTPRequestHandler):
 
         elif self.path == '/default':
             try:
-                servo_positions = {}
-                for servo_id, limits in gestures["servo_limits"].items():
-                    servo_id_int = int(servo_id.split('_')[1])
-                    if servo_id == 'servo_12':  # Thumb MCP roll - use min
-                        servo_positions[servo_id_int] = limits["min"]
-                    else:  # All other servos - use min + offset
-                        offset = 60  # Default offset
-                        servo_positions[servo_id_int] = min(limits["min"] + offset, limits["max"])
-                
-                # Update current_positions for URDF sync
-                current_positions.update(servo_positions)
-                
-                # Only try to move servos if connected
-                if groupSyncWrite:
-                    success = move_servos(servo_positions)
-                else:
-                    success = True  # Consider it successful if not connected
-                    
+                # Updates current_positions for URDF sync, and only moves the servos if connected
+                success = controller.move_to_default()
+
                 self.send_response(200 if success else 500)
                 self.send_header('Cache-Control', 'no-cache, no-store, must-revalidate')
                 self.send_header('Pragma', 'no-cache')
@@ -515,7 +324,7 @@ class GestureHandler(http.server.SimpleHTTPRequestHandler):
 
         elif self.path == '/add_gesture':
             gesture = data['gesture']
-            if gesture in gestures['gestures']:
+            if controller.store.has_gesture(gesture):
                 self.send_response(400)
                 self.send_header('Cache-Control', 'no-cache, no-store, must-revalidate')
                 self.send_header('Pragma', 'no-cache')
@@ -524,10 +333,8 @@ class GestureHandler(http.server.SimpleHTTPRequestHandler):
                 self.wfile.write(b"Gesture already exists")
                 return
 
-            default_positions = {servo_id: limits["min"] for servo_id, limits in gestures["servo_limits"].items()}
-            gestures['gestures'][gesture] = default_positions
-            with open('gestures.json', 'w') as f:
-                json.dump(gestures, f, indent=2)
+            default_positions = {servo_id: limits["min"] for servo_id, limits in controller.servo_limits.items()}
+            controller.store.save_gesture(gesture, default_positions)
             # Gesture added successfully
             self.send_response(200)
             self.send_header('Cache-Control', 'no-cache, no-store, must-revalidate')
@@ -537,7 +344,8 @@ class GestureHandler(http.server.SimpleHTTPRequestHandler):
 
         elif self.path == '/remove_gesture':
             gesture = data['gesture']
-            if gesture not in gestures['gestures']:
+            # Steps referencing the gesture are purged through the reverse index
+            if not controller.store.remove_gesture(gesture):
                 self.send_response(404)
                 self.send_header('Cache-Control', 'no-cache, no-store, must-revalidate')
                 self.send_header('Pragma', 'no-cache')
@@ -546,11 +354,6 @@ class GestureHandler(http.server.SimpleHTTPRequestHandler):
                 self.wfile.write(b"Gesture not found")
                 return
 
-            del gestures['gestures'][gesture]
-            for sequence_id in gestures["sequences"]:
-                gestures["sequences"][sequence_id] = [step for step in gestures["sequences"][sequence_id] if step["gesture"] != gesture]
-            with open('gestures.json', 'w') as f:
-                json.dump(gestures, f, indent=2)
             # Gesture removed successfully
             self.send_response(200)
             self.send_header('Cache-Control', 'no-cache, no-store, must-revalidate')
@@ -561,9 +364,7 @@ class GestureHandler(http.server.SimpleHTTPRequestHandler):
         elif self.path == '/add_sequence':
             sequenceId = data['sequenceId']
             sequence = data['sequence']
-            gestures['sequences'][sequenceId] = sequence
-            with open('gestures.json', 'w') as f:
-                json.dump(gestures, f, indent=2)
+            controller.store.save_sequence(sequenceId, sequence)
             # Sequence added successfully
             self.send_response(200)
             self.send_header('Cache-Control', 'no-cache, no-store, must-revalidate')
@@ -574,9 +375,7 @@ class GestureHandler(http.server.SimpleHTTPRequestHandler):
         elif self.path == '/update_sequence':
             sequenceId = data['sequenceId']
             sequence = data['sequence']
-            gestures['sequences'][sequenceId] = sequence
-            with open('gestures.json', 'w') as f:
-                json.dump(gestures, f, indent=2)
+            controller.store.save_sequence(sequenceId, sequence)
             # Sequence updated successfully
             self.send_response(200)
             self.send_header('Cache-Control', 'no-cache, no-store, must-revalidate')
@@ -586,7 +385,7 @@ class GestureHandler(http.server.SimpleHTTPRequestHandler):
 
         elif self.path == '/delete_sequence':
             sequenceId = data['sequenceId']
-            if sequenceId not in gestures['sequences']:
+            if not controller.store.delete_sequence(sequenceId):
                 self.send_response(404)
                 self.send_header('Cache-Control', 'no-cache, no-store, must-revalidate')
                 self.send_header('Pragma', 'no-cache')
@@ -595,9 +394,6 @@ class GestureHandler(http.server.SimpleHTTPRequestHandler):
                 self.wfile.write(b"Sequence not found")
                 return
 
-            del gestures['sequences'][sequenceId]
-            with open('gestures.json', 'w') as f:
-                json.dump(gestures, f, indent=2)
             # Sequence deleted successfully
             self.send_response(200)
             self.send_header('Cache-Control', 'no-cache, no-store, must-revalidate')
@@ -607,9 +403,7 @@ class GestureHandler(http.server.SimpleHTTPRequestHandler):
 
         elif self.path == '/update_servo_limits':
             new_limits = data
-            gestures["servo_limits"] = new_limits
-            with open('gestures.json', 'w') as f:
-                json.dump(gestures, f, indent=2)
+            controller.update_servo_limits(new_limits)
             # Servo limits updated successfully
             self.send_response(200)
             self.send_header('Cache-Control', 'no-cache, no-store, must-revalidate')
@@ -619,9 +413,7 @@ class GestureHandler(http.server.SimpleHTTPRequestHandler):
 
         elif self.path == '/update_settings':
             new_settings = data
-            gestures["settings"] = new_settings
-            with open('gestures.json', 'w') as f:
-                json.dump(gestures, f, indent=2)
+            controller.store.set_config("settings", new_settings)
             # Settings updated successfully
             self.send_response(200)
             self.send_header('Cache-Control', 'no-cache, no-store, must-revalidate')
@@ -629,9 +421,18 @@ class GestureHandler(http.server.SimpleHTTPRequestHandler):
             self.send_header('Expires', '0')
             self.end_headers()
 
+        elif self.path == '/import_gestures':
+            controller.store.import_data({"gestures": data.get("gestures", {}), "sequences": data.get("sequences", {})})
+            print(f"Imported {len(data.get('gestures', {}))} gestures and {len(data.get('sequences', {}))} sequences")
+            self.send_response(200)
+            self.send_header('Cache-Control', 'no-cache, no-store, must-revalidate')
+            self.send_header('Pragma', 'no-cache')
+            self.send_header('Expires', '0')
+            self.end_headers()
+
         elif self.path == '/save_calibration':
             calibration_data = data.get('calibration', {})
-            with open('hand_calibration.json', 'w') as f:
+            with open(CALIBRATION_PATH, 'w') as f:
                 json.dump({"calibration": calibration_data}, f, indent=2)
             print("Saved hand calibration")
             self.send_response(200)
@@ -640,11 +441,33 @@ class GestureHandler(http.server.SimpleHTTPRequestHandler):
             self.send_header('Expires', '0')
             self.end_headers()
 
+        elif self.path == '/simulate':
+            # Batch mode: play gestures and sequences headless as fast as possible
+            try:
+                report = controller.simulate(data.get('sequences'), data.get('gestures'), data.get('thumb_clearance', False))
+                response = json.dumps(report).encode()
+                print(f"Simulated batch in {report['elapsed']:.2f} s")
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Cache-Control', 'no-cache, no-store, must-revalidate')
+                self.send_header('Pragma', 'no-cache')
+                self.send_header('Expires', '0')
+                self.end_headers()
+                self.wfile.write(response)
+            except Exception as e:
+                print(f"Error in /simulate endpoint: {e}")
+                self.send_response(500)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Cache-Control', 'no-cache, no-store, must-revalidate')
+                self.send_header('Pragma', 'no-cache')
+                self.send_header('Expires', '0')
+                self.end_headers()
+                self.wfile.write(json.dumps({"status": "failed", "message": str(e)}).encode())
+
         elif self.path == '/connect':
             device_name = data['device_name']
-            success, message = initialize_servos(device_name)
+            success, message = controller.connect(device_name)
             if success:
-                groupSyncWrite = GroupSyncWrite(portHandler, packetHandler, ADDR_SCS_GOAL_POSITION, 2)
                 print(f"Connected to device {device_name}")
                 self.send_response(200)
                 self.send_header('Content-Type', 'application/json')
@@ -668,19 +491,7 @@ def cleanup(httpd=None):
     server_shutdown = True
     print("Cleaning up resources...")
     try:
-        if portHandler and portHandler.is_open:
-            for servo_id in [int(sid.split('_')[1]) for sid in servo_limits.keys()]:
-                try:
-                    portHandler.setPacketTimeout(SERVO_TIMEOUT * 1000)
-                    scs_comm_result, scs_error = packetHandler.write1ByteTxRx(portHandler, servo_id, ADDR_SCS_TORQUE_ENABLE, 0)
-                    if scs_comm_result != COMM_SUCCESS:
-                        print(f"Error disabling torque for servo {servo_id}: {packetHandler.getTxRxResult(scs_comm_result)}")
-                    if scs_error != 0:
-                        print(f"Error disabling torque for servo {servo_id}: {packetHandler.getRxPacketError(scs_error)}")
-                except Exception as e:
-                    print(f"Error disabling torque for servo {servo_id}: {e}")
-            portHandler.closePort()
-            print("Port closed successfully")
+        controller.close()
         if httpd:
             httpd.server_close()
             print("Server socket closed")
@@ -703,20 +514,41 @@ class CustomThreadingTCPServer(socketserver.ThreadingTCPServer):
         self.socket.bind(self.server_address)
 
 PORT = 8000
-Handler = GestureHandler
-
-try:
-    with CustomThreadingTCPServer(("", PORT), Handler) as httpd:
-        signal.signal(signal.SIGINT, lambda sig, frame: signal_handler(sig, frame, httpd))
-        print("Server running at http://localhost:8000")
-        try:
-            httpd.serve_forever()
-        except KeyboardInterrupt:
-            print("Keyboard interrupt received, shutting down server...")
-            cleanup(httpd)
-        except Exception as e:
-            print(f"Server error: {e}")
-            cleanup(httpd)
-except Exception as e:
-    print(f"Failed to start server: {e}")
-    cleanup()
\ No newline at end of file
+# Serve files from the RHControl folder regardless of the working directory
+Handler = functools.partial(GestureHandler, directory=BASE_DIR)
+
+def serve(hand, port=PORT, background=False):
+    """Serve the web interface and HTTP API for a HandController."""
+    global controller
+    controller = hand
+
+    if background:
+        httpd = CustomThreadingTCPServer(("", port), Handler)
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        print(f"Server running at http://localhost:{port}")
+        return httpd
+
+    try:
+        with CustomThreadingTCPServer(("", port), Handler) as httpd:
+            signal.signal(signal.SIGINT, lambda sig, frame: signal_handler(sig, frame, httpd))
+            print(f"Server running at http://localhost:{port}")
+            try:
+                httpd.serve_forever()
+            except KeyboardInterrupt:
+                print("Keyboard interrupt received, shutting down server...")
+                cleanup(httpd)
+            except Exception as e:
+                print(f"Server error: {e}")
+                cleanup(httpd)
+    except Exception as e:
+        print(f"Failed to start server: {e}")
+        cleanup()
+
+if __name__ == "__main__":
+    hand = HandController(verbose=True)
+    try:
+        hand.load()
+    except RuntimeError as e:
+        print(e)
+        sys.exit(1)
+    serve(hand)
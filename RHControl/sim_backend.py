@@ -0,0 +1,396 @@
+import json
+import os
+import sys
+import threading
+import time
+import xml.etree.ElementTree as ET
+
+try:
+    import mujoco
+except ImportError:
+    mujoco = None
+
+# Device name used by the web interface to select the simulation backend
+SIMULATION_DEVICE = "simulation"
+
+DESCRIPTIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "descriptions")
+MJCF_PATH = os.path.join(DESCRIPTIONS_DIR, "RoninHand.mjcf")
+MESH_DIR = os.path.join(DESCRIPTIONS_DIR, "meshes")
+
+# Servo to MJCF joint mapping (same as jointMapping in index.html)
+SERVO_JOINT_MAP = {
+    1: "pinky_pip",
+    2: "ring_pip",
+    3: "ring_mcp",
+    4: "middle_mcp",
+    5: "middle_pip",
+    6: "index_pip",
+    7: "pinky_mcp",
+    8: "index_mcp",
+    9: "thumb_mcp",
+    10: "thumb_pip",
+    12: "thumb_abduction",
+}
+
+# DIP joints move with their corresponding PIP joints
+COUPLED_JOINTS = {
+    "pinky_pip": "pinky_dip",
+    "ring_pip": "ring_dip",
+    "middle_pip": "middle_dip",
+    "index_pip": "index_dip",
+    "thumb_pip": "thumb_dip",
+}
+
+# Position servo gains applied to the MJCF motor actuators
+SERVO_KP = 1.0
+SERVO_KV = 0.02
+
+# Physics timestep (in seconds)
+SIM_TIMESTEP = 0.002
+
+# Physics steps run in C between contact checks
+CONTACT_CHECK_STEPS = 5
+
+# A joint counts as having reached its target within this error (in radians)
+REACHED_TOLERANCE = 0.05
+
+# Default pose offset above each servo's min position
+DEFAULT_POSITION_OFFSET = 60
+
+# Default step delay used when a sequence step has none (in milliseconds)
+DEFAULT_STEP_DELAY = 2000
+
+# Delay between thumb clearance stages when settings has no gesture_step_delay (in milliseconds)
+GESTURE_STEP_DELAY = 50
+
+# Servos moved in the second and third thumb clearance stages
+FINGER_SERVOS = [1, 2, 3, 4, 5, 6, 7, 8]
+THUMB_SERVOS = [9, 10, 12]
+
+# How long a single gesture is held when validated on its own (in milliseconds)
+GESTURE_HOLD_TIME = 1000
+
+
+def default_pose(servo_limits):
+    """Return the default pose: thumb MCP roll at min, all other servos at min + offset."""
+    positions = {}
+    for sid, limits in servo_limits.items():
+        servo_id_int = int(sid.split('_')[1])
+        if sid == 'servo_12':  # Thumb MCP roll - use min
+            positions[servo_id_int] = limits["min"]
+        else:  # All other servos - use min + offset
+            positions[servo_id_int] = min(limits["min"] + DEFAULT_POSITION_OFFSET, limits["max"])
+    return positions
+
+
+def thumb_clearance_stages(servo_limits, positions):
+    """Split a move into thumb clearance stages: thumb roll to min, then fingers, then thumb."""
+    return [
+        {12: servo_limits["servo_12"]["min"]},
+        {sid: positions[sid] for sid in FINGER_SERVOS if sid in positions},
+        {sid: positions[sid] for sid in THUMB_SERVOS if sid in positions},
+    ]
+
+
+def load_model(mjcf_path=MJCF_PATH, mesh_dir=MESH_DIR):
+    """Compile the MJCF model, resolving meshes against the descriptions folder."""
+    if mujoco is None:
+        raise RuntimeError("mujoco is not installed. Install it with: pip install mujoco")
+
+    root = ET.parse(mjcf_path).getroot()
+    asset = root.find("asset")
+    missing_meshes = set()
+    for mesh in asset.findall("mesh"):
+        mesh_path = os.path.join(mesh_dir, os.path.basename(mesh.get("file")))
+        if os.path.exists(mesh_path):
+            mesh.set("file", mesh_path)
+        else:
+            missing_meshes.add(mesh.get("name"))
+            asset.remove(mesh)
+
+    # Links without a mesh keep their inertials, they just have no geometry
+    if missing_meshes:
+        print(f"Simulation: meshes not found, skipping geoms for {sorted(missing_meshes)}")
+        for body in root.iter("body"):
+            for geom in body.findall("geom"):
+                if geom.get("mesh") in missing_meshes:
+                    body.remove(geom)
+
+    # Collision geoms ship with contype=0, which disables contacts between links.
+    # The palm stays out: its convex hull fills the space the fingers curl into.
+    for default in root.iter("default"):
+        if default.get("class") == "collision":
+            default.find("geom").set("contype", "1")
+    for geom in root.iter("geom"):
+        if geom.get("name") == "palm_collision":
+            geom.set("contype", "0")
+            geom.set("conaffinity", "0")
+
+    model = mujoco.MjModel.from_xml_string(ET.tostring(root, encoding="unicode"))
+    model.opt.timestep = SIM_TIMESTEP
+    model.opt.integrator = mujoco.mjtIntegrator.mjINT_IMPLICITFAST
+
+    # Turn the torque motors into position servos so ctrl holds a target angle
+    model.actuator_gaintype[:] = mujoco.mjtGain.mjGAIN_FIXED
+    model.actuator_gainprm[:, 0] = SERVO_KP
+    model.actuator_biastype[:] = mujoco.mjtBias.mjBIAS_AFFINE
+    model.actuator_biasprm[:, :3] = [0.0, -SERVO_KP, -SERVO_KV]
+    return model
+
+
+class HandSimulation:
+    """Headless MuJoCo simulation of the hand driven by servo positions."""
+
+    def __init__(self, servo_limits, model=None):
+        self.model = model if model is not None else load_model()
+        self.data = mujoco.MjData(self.model)
+        self.servo_limits = servo_limits
+        self.lock = threading.Lock()
+
+        self.joint_ranges = {}
+        self.joint_qpos = {}
+        self.joint_actuators = {}
+        for actuator_id in range(self.model.nu):
+            joint_id = self.model.actuator_trnid[actuator_id, 0]
+            name = mujoco.mj_id2name(self.model, mujoco.mjtObj.mjOBJ_JOINT, joint_id)
+            self.joint_ranges[name] = tuple(float(limit) for limit in self.model.jnt_range[joint_id])
+            self.joint_qpos[name] = self.model.jnt_qposadr[joint_id]
+            self.joint_actuators[name] = actuator_id
+
+        self.body_names = [mujoco.mj_id2name(self.model, mujoco.mjtObj.mjOBJ_BODY, i) for i in range(self.model.nbody)]
+        self.active_contacts = set()
+        self.contact_events = []
+
+    def servo_to_joint_angle(self, servo_id, position):
+        """Map a servo position linearly onto its joint range (min is open, max is closed)."""
+        limits = self.servo_limits[f"servo_{servo_id}"]
+        span = limits["max"] - limits["min"]
+        normalized = (position - limits["min"]) / span if span else 0.0
+        normalized = max(0.0, min(normalized, 1.0))
+        low, high = self.joint_ranges[SERVO_JOINT_MAP[servo_id]]
+        return low + normalized * (high - low)
+
+    def joint_targets(self, servo_positions):
+        """Return the joint angle targets for a set of servo positions."""
+        targets = {}
+        for servo_id, position in servo_positions.items():
+            joint = SERVO_JOINT_MAP.get(servo_id)
+            if joint is None:
+                continue
+            angle = self.servo_to_joint_angle(servo_id, position)
+            targets[joint] = angle
+            if joint in COUPLED_JOINTS:
+                targets[COUPLED_JOINTS[joint]] = angle
+        return targets
+
+    def set_servo_positions(self, servo_positions):
+        """Set actuator targets from servo positions keyed by integer servo id."""
+        targets = self.joint_targets(servo_positions)
+        with self.lock:
+            for joint, angle in targets.items():
+                self.data.ctrl[self.joint_actuators[joint]] = angle
+        return targets
+
+    def reset(self, servo_positions=None):
+        """Reset the physics state, optionally starting at the given servo positions."""
+        with self.lock:
+            mujoco.mj_resetData(self.model, self.data)
+            if servo_positions:
+                for joint, angle in self.joint_targets(servo_positions).items():
+                    self.data.qpos[self.joint_qpos[joint]] = angle
+                    self.data.ctrl[self.joint_actuators[joint]] = angle
+            mujoco.mj_forward(self.model, self.data)
+            self.active_contacts = self._contact_pairs()
+            self.contact_events = []
+
+    def _contact_pairs(self):
+        bodies1 = self.model.geom_bodyid[self.data.contact.geom1]
+        bodies2 = self.model.geom_bodyid[self.data.contact.geom2]
+        return {tuple(sorted((self.body_names[b1], self.body_names[b2]))) for b1, b2 in zip(bodies1, bodies2)}
+
+    def step(self, duration):
+        """Advance the simulation by duration seconds, recording contact onsets."""
+        with self.lock:
+            steps = max(1, round(duration / self.model.opt.timestep))
+            while steps > 0:
+                nstep = min(steps, CONTACT_CHECK_STEPS)
+                mujoco.mj_step(self.model, self.data, nstep=nstep)
+                steps -= nstep
+                contacts = self._contact_pairs()
+                for pair in sorted(contacts - self.active_contacts):
+                    self.contact_events.append({"time": round(self.data.time, 4), "bodies": list(pair)})
+                self.active_contacts = contacts
+
+    def joint_positions(self):
+        """Return the current joint angles keyed by joint name."""
+        with self.lock:
+            return {joint: float(self.data.qpos[adr]) for joint, adr in self.joint_qpos.items()}
+
+    def read_state(self):
+        """Return a JSON-serializable snapshot of the simulation."""
+        joints = self.joint_positions()
+        with self.lock:
+            return {
+                "time": self.data.time,
+                "joints": joints,
+                "contacts": [list(pair) for pair in sorted(self.active_contacts)],
+            }
+
+
+class RealtimeSimulation:
+    """Steps a HandSimulation in lockstep with wall-clock time on a background thread."""
+
+    def __init__(self, sim, control_period=0.01):
+        self.sim = sim
+        self.control_period = control_period
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+
+    def _run(self):
+        next_tick = time.perf_counter()
+        while self.running:
+            self.sim.step(self.control_period)
+            next_tick += self.control_period
+            delay = next_tick - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            elif delay < -self.control_period:
+                # Physics cannot keep up, drop the backlog instead of spiralling
+                next_tick = time.perf_counter()
+
+
+def _gesture_positions(gesture):
+    return {int(servo.split('_')[1]): value for servo, value in gesture.items()}
+
+
+def run_sequence(sim, gestures, sequence, default_delay=DEFAULT_STEP_DELAY, thumb_clearance=False,
+                 stage_delay=GESTURE_STEP_DELAY):
+    """Play a sequence as fast as possible and report the pose reached at each step.
+
+    With thumb_clearance each gesture is played in the three stages used by
+    HandController.execute, stage_delay milliseconds apart, before its delay.
+    """
+    steps = []
+    for step in sequence:
+        gesture = step.get("gesture")
+        delay = step.get("delay", default_delay)
+        if gesture not in gestures["gestures"]:
+            steps.append({"gesture": gesture, "error": "Gesture not found"})
+            continue
+        first_event = len(sim.contact_events)
+        positions = _gesture_positions(gestures["gestures"][gesture])
+        if thumb_clearance:
+            stages = thumb_clearance_stages(sim.servo_limits, positions)
+            for stage in stages[:-1]:
+                sim.set_servo_positions(stage)
+                sim.step(stage_delay / 1000.0)
+            sim.set_servo_positions(stages[-1])
+            targets = sim.joint_targets(positions)
+        else:
+            targets = sim.set_servo_positions(positions)
+        sim.step(delay / 1000.0)
+        joints = sim.joint_positions()
+        errors = {joint: abs(joints[joint] - target) for joint, target in targets.items()}
+        max_error = max(errors.values(), default=0.0)
+        steps.append({
+            "gesture": gesture,
+            "delay": delay,
+            "reached": max_error <= REACHED_TOLERANCE,
+            "max_error": max_error,
+            "unreached_joints": sorted(joint for joint, error in errors.items() if error > REACHED_TOLERANCE),
+            "joints": joints,
+            "contact_events": sim.contact_events[first_event:],
+        })
+    return {
+        "steps": steps,
+        "passed": all(step.get("reached", False) for step in steps),
+        "sim_time": sim.data.time,
+    }
+
+
+def run_batch(gestures, sequence_ids=None, gesture_names=None, default_positions=None, model=None,
+              thumb_clearance=False):
+    """Validate gestures and sequences headless, faster than real time.
+
+    Each gesture is held from the default pose for GESTURE_HOLD_TIME, and
+    each sequence is played step by step with its own delays. The compiled model
+    is shared between runs so only the physics state is reset in between.
+    default_positions defaults to default_pose(servo_limits). thumb_clearance
+    plays every gesture in stages, like the web interface's thumb clearance mode.
+    """
+    servo_limits = gestures["servo_limits"]
+    if default_positions is None:
+        default_positions = default_pose(servo_limits)
+    settings = gestures.get("settings", {})
+    default_delay = settings.get("default_sequence_step_delay", DEFAULT_STEP_DELAY)
+    stage_delay = settings.get("gesture_step_delay", GESTURE_STEP_DELAY)
+    sim = HandSimulation(servo_limits, model=model)
+
+    if sequence_ids is None:
+        sequence_ids = list(gestures.get("sequences", {}).keys())
+    if gesture_names is None:
+        gesture_names = list(gestures["gestures"].keys())
+
+    start_time = time.time()
+    report = {"thumb_clearance": thumb_clearance, "gestures": {}, "sequences": {}}
+    for name in gesture_names:
+        sim.reset(default_positions)
+        report["gestures"][name] = run_sequence(sim, gestures, [{"gesture": name, "delay": GESTURE_HOLD_TIME}],
+                                                thumb_clearance=thumb_clearance, stage_delay=stage_delay)
+    for sequence_id in sequence_ids:
+        if sequence_id not in gestures.get("sequences", {}):
+            report["sequences"][sequence_id] = {"error": "Sequence not found", "passed": False}
+            continue
+        sim.reset(default_positions)
+        report["sequences"][sequence_id] = run_sequence(sim, gestures, gestures["sequences"][sequence_id], default_delay,
+                                                     thumb_clearance, stage_delay)
+    report["elapsed"] = time.time() - start_time
+    return report
+
+
+if __name__ == "__main__":
+    # Usage: python sim_backend.py [--db gestures.db | --json gestures.json] [--gestures] [--thumb-clearance]
+    from gesture_store import GestureStore
+
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    args = sys.argv[1:]
+    db_path = args[args.index("--db") + 1] if "--db" in args else os.path.join(base_dir, "gestures.db")
+    json_path = args[args.index("--json") + 1] if "--json" in args else None
+    if json_path is None and not os.path.exists(db_path):
+        # Nothing has been migrated yet, so gestures.json is still the source of truth
+        json_path = os.path.join(base_dir, "gestures.json")
+    if json_path is not None:
+        with open(json_path, 'r') as f:
+            gestures = json.load(f)
+    else:
+        store = GestureStore(db_path)
+        gestures = store.to_dict()
+        store.close()
+    gesture_names = list(gestures["gestures"].keys()) if "--gestures" in sys.argv else []
+    report = run_batch(gestures, gesture_names=gesture_names, default_positions=default_pose(gestures["servo_limits"]),
+                       thumb_clearance="--thumb-clearance" in sys.argv)
+    for kind in ("gestures", "sequences"):
+        for name, result in report[kind].items():
+            status = "PASS" if result.get("passed") else "FAIL"
+            print(f"{status} {kind[:-1]} {name}")
+            for step in result.get("steps", []):
+                if "error" in step:
+                    print(f"    {step['gesture']}: {step['error']}")
+                elif not step["reached"]:
+                    print(f"    {step['gesture']}: max error {step['max_error']:.3f} rad on {step['unreached_joints']}")
+                for event in step.get("contact_events", []):
+                    print(f"    {step['gesture']}: contact {event['bodies'][0]} / {event['bodies'][1]} at {event['time']:.3f} s")
+    print(f"Simulated in {report['elapsed']:.2f} s")